@@ -1,11 +1,139 @@
 import streamlit as st
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 import aiohttp
 import asyncio
-from bs4 import BeautifulSoup
-from urllib.parse import urlparse
+import hashlib
+import random
+import re
+import ssl
+import threading
 import time
-from tenacity import retry, stop_after_attempt, wait_exponential
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from lxml import etree, html as lxml_html
+
+try:
+    import uvloop
+except ImportError:  # Windows hoặc chưa cài uvloop
+    uvloop = None
+
+_URL_RE = re.compile(r'^https?://[^\s/?#]+', re.I)
+_WORD_RE = re.compile(r'\S+')
+_MULTISPACE = re.compile(r'\s+')
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?…])\s+')
+_RESPONSE_RE = re.compile(r'TITLE:\s*(?P<title>.*?)\s*ARTICLE:\s*(?P<article>.*)', re.S | re.I)
+_TITLE_RE = re.compile(r'TITLE:\s*(?P<title>.*)', re.S | re.I)
+# lxml không nhận chuỗi unicode có khai báo encoding XML
+_XML_DECL_RE = re.compile(r'^\s*<\?xml[^>]*\?>')
+
+# XPath biên dịch sẵn cho extract_content
+_CONTENT_CLASSES = ('content', 'article', 'post')
+_NOISE_TAGS = ('script', 'style', 'nav', 'header', 'footer', 'iframe', 'aside')
+_XP_H1 = etree.XPath('(//h1)[1]')
+_XP_TITLE = etree.XPath('(//title)[1]')
+_XP_ARTICLE_P = etree.XPath(
+    '//*[self::article or self::main or self::div][{}]//p'.format(' or '.join(
+        f"contains(concat(' ', normalize-space(@class), ' '), ' {c} ')" for c in _CONTENT_CLASSES
+    ))
+)
+_XP_ALL_P = etree.XPath('//p')
+# Giới hạn độ dài nội dung mỗi bài gửi cho Gemini
+_MAX_CONTENT_CHARS = 15000
+# Content-Type được chấp nhận và giới hạn dung lượng HTML đọc từ mỗi URL
+_HTML_TYPES = ('text/html', 'application/xhtml+xml')
+_MAX_HTML_BYTES = 2_000_000
+# Ngưỡng có khoảng đệm để không tốn thêm một lần gọi Gemini cho kết quả chỉ lệch chút ít:
+# tiêu đề yêu cầu tối đa 15 từ, bài viết 800-1000 từ
+_TITLE_REWRITE_WORDS = 17
+_EXPAND_BELOW_WORDS = 600
+# Nguồn quá ngắn thì chấp nhận bài ngắn thay vì bắt Gemini "mở rộng" thêm
+_EXPAND_MIN_SOURCE_CHARS = 3000
+# Bài 800-1000 từ tiếng Việt cần khoảng 2000-3000 token đầu ra, 4096 để không bị cắt
+_GENERATION_CONFIG = genai.GenerationConfig(max_output_tokens=4096, temperature=0.5, top_p=0.9)
+# Số lần gọi Gemini tối đa (kể cả lần đầu) và thời gian chờ gợi ý trong lỗi 429
+_GEMINI_MAX_ATTEMPTS = 3
+_RETRY_DELAY_RE = re.compile(r'retry_delay\s*\{\s*seconds:\s*(\d+)|retry in ([\d.]+)\s*s', re.I)
+# Chỉ thử lại lỗi tạm thời: 429 (hết quota/rate limit) và lỗi 5xx phía server
+_RETRYABLE_ERRORS = (google_exceptions.TooManyRequests, google_exceptions.ServerError)
+# Số request/phút gửi tới Gemini, cho phép dồn tối đa _GEMINI_BURST lệnh gọi liền nhau
+_GEMINI_RPM = 60
+_GEMINI_BURST = 4
+# Timeout dùng chung; connect/sock_read riêng để DNS chậm không ăn hết 30s
+_DEFAULT_TIMEOUT = aiohttp.ClientTimeout(total=30, connect=5, sock_read=15)
+# Nạp kho chứng chỉ một lần khi import thay vì mỗi lần tạo connector
+_SSL_CONTEXT = ssl.create_default_context()
+
+# Phần hướng dẫn cố định đặt ở đầu prompt, nội dung các nguồn nối vào cuối,
+# để tiền tố giống hệt nhau giữa các lần gọi (tận dụng implicit prefix caching)
+_ANALYSIS_INSTRUCTIONS = """
+Phân tích và tổng hợp thành một bài báo mới từ các nguồn ở cuối prompt.
+
+Yêu cầu:
+
+1. Tiêu đề bài báo:
+   - Tối đa 15 từ
+   - Thu hút, tạo ấn tượng mạnh
+   - Phản ánh chính xác nội dung chính
+   - Sử dụng từ ngữ báo chí chuẩn mực
+   - Tránh giật gân, câu view
+
+2. Cấu trúc bài viết:
+   - Tóm tắt ý chính trong đoạn mở đầu (3-4 câu)
+   - Triển khai chi tiết theo logic rõ ràng
+   - Dẫn nguồn và trích dẫn khi cần
+   - Phân tích, đánh giá khách quan
+   - Kết luận súc tích, đầy đủ
+
+3. Nội dung:
+   - Tổng hợp thông tin từ nhiều nguồn
+   - Đảm bảo tính chính xác
+   - Cung cấp góc nhìn đa chiều
+   - Thêm số liệu, dữ liệu cụ thể
+   - Độ dài 800-1000 từ (bắt buộc tối thiểu 800 từ)
+
+4. Ngôn ngữ:
+   - Trong sáng, dễ hiểu
+   - Phong cách báo chí chuyên nghiệp
+   - Khách quan, trung lập
+   - Tránh từ ngữ cảm xúc, thiên kiến
+   - Chọn lọc từ ngữ phù hợp văn phong
+
+Format phản hồi:
+TITLE: [tiêu đề bài báo]
+ARTICLE: [nội dung bài báo]
+
+Các nguồn:
+
+"""
+
+_OPTIMIZE_TITLE_PROMPT = """
+Tối ưu tiêu đề sau để ngắn gọn hơn (tối đa 15 từ) nhưng vẫn giữ được ý chính:
+{title}
+
+Yêu cầu:
+- Rút gọn nhưng không mất ý nghĩa
+- Vẫn phải thu hút, ấn tượng
+- Dùng từ ngữ chính xác, súc tích
+- Phù hợp phong cách báo chí
+
+Format: TITLE: [tiêu đề tối ưu]
+"""
+
+_EXPAND_PROMPT = """
+Mở rộng nội dung bài báo sau để đạt 800-1000 từ.
+Thêm chi tiết, phân tích sâu hơn nhưng vẫn giữ được tính mạch lạc và phong cách ban đầu.
+
+Bài báo hiện tại:
+{content}
+"""
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Accept': 'text/html,application/xhtml+xml',
+    # aiohttp tự giải nén; brotli cần gói aiohttp[speedups]
+    'Accept-Encoding': 'gzip, deflate, br'
+}
 
 def check_api_key():
     """
@@ -21,201 +149,411 @@ def check_api_key():
         st.error("⚠️ GEMINI_API_KEY chưa được cấu hình trong Streamlit Secrets!")
         st.stop()
 
+@st.cache_resource
+def get_model(api_key):
+    """
+    Cấu hình Gemini và tạo model một lần, dùng lại qua các lần rerun của Streamlit
+    """
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel('gemini-pro', generation_config=_GENERATION_CONFIG)
+
 def validate_url(url):
     """
-    Kiểm tra URL hợp lệ
+    Kiểm tra URL hợp lệ (http/https và có tên miền)
+    """
+    return bool(_URL_RE.match(url))
+
+def retry_after(error):
+    """
+    Lấy thời gian chờ (giây) mà Gemini gợi ý trong lỗi 429, nếu có
+    """
+    match = _RETRY_DELAY_RE.search(str(error))
+    if not match:
+        return None
+    return min(60.0, float(match.group(1) or match.group(2)))
+
+def run_async(coro):
+    """
+    Chạy coroutine trên uvloop nếu có, ngược lại dùng event loop mặc định của asyncio
+    """
+    if uvloop is not None:
+        return uvloop.run(coro)
+    return asyncio.run(coro)
+
+def count_words(text):
+    """
+    Đếm số từ mà không tạo list như len(text.split())
+    """
+    return sum(1 for _ in _WORD_RE.finditer(text))
+
+def dedupe_sentences(text, seen):
+    """
+    Bỏ các câu đã xuất hiện ở các nguồn trước (seen là tập hash dùng chung giữa các
+    nguồn) để không gửi lặp nội dung trùng nhau giữa các bài cho Gemini. Câu lặp lại
+    trong cùng một bài vẫn được giữ; hash của bài này chỉ được thêm vào seen sau khi lọc xong
+    """
+    kept = []
+    keys = set()
+    for sentence in _SENTENCE_END_RE.split(text):
+        key = hashlib.blake2b(sentence.lower().encode(), digest_size=8).digest()
+        if key not in seen:
+            keys.add(key)
+            kept.append(sentence)
+    seen.update(keys)
+    return ' '.join(kept)
+
+def parse_article_response(text):
+    """
+    Tách (tiêu đề, nội dung) từ phản hồi TITLE/ARTICLE của Gemini
+    """
+    match = _RESPONSE_RE.search(text)
+    if not match:
+        raise ValueError("Phản hồi thiếu TITLE/ARTICLE")
+    return match['title'].strip(), match['article'].strip()
+
+def parse_title_response(text):
+    """
+    Lấy tiêu đề từ phản hồi TITLE của Gemini
+    """
+    match = _TITLE_RE.search(text)
+    if not match:
+        raise ValueError("Phản hồi thiếu TITLE")
+    return match['title'].strip()
+
+def extract_content(html):
+    """
+    Trích xuất nội dung từ HTML
     """
     try:
-        result = urlparse(url)
-        return all([result.scheme, result.netloc])
-    except:
-        return False
+        if not html or not html.strip():
+            return {'title': "", 'content': ""}
+        doc = lxml_html.document_fromstring(_XML_DECL_RE.sub('', html, count=1))
+        
+        # Loại bỏ các phần không cần thiết trong một lượt duyệt C
+        # (with_tail=False giữ lại phần text phía sau thẻ)
+        etree.strip_elements(doc, *_NOISE_TAGS, with_tail=False)
+        
+        # Lấy tiêu đề
+        title_tags = _XP_H1(doc) or _XP_TITLE(doc)
+        title = title_tags[0].text_content() if title_tags else ""
+        
+        # Lấy nội dung chính
+        paragraphs = _XP_ARTICLE_P(doc)
+        if not paragraphs:
+            # Nếu không tìm thấy thẻ article, lấy tất cả thẻ p
+            paragraphs = _XP_ALL_P(doc)
+        
+        # Dừng gom đoạn văn khi đã đủ độ dài, tránh nối cả phần bình luận cuối trang
+        parts = []
+        total = 0
+        for p in paragraphs:
+            text = p.text_content()
+            parts.append(text)
+            total += len(text) + 1
+            if total >= _MAX_CONTENT_CHARS:
+                break
+        content = ' '.join(parts)
+        
+        # Gộp khoảng trắng/xuống dòng thừa trong một lượt regex
+        return {
+            'title': _MULTISPACE.sub(' ', title).strip(),
+            'content': _MULTISPACE.sub(' ', content).strip()[:_MAX_CONTENT_CHARS]
+        }
+        
+    except Exception as e:
+        raise Exception(f"Lỗi khi xử lý HTML: {str(e)}")
+
+class LRUCache:
+    """
+    Cache LRU giới hạn số phần tử (tùy chọn thời gian sống ttl, tính bằng giây),
+    an toàn khi dùng từ nhiều thread
+    """
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            stored_at, value = item
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                # Giữ lại phần tử hết hạn cho peek(), LRU sẽ tự loại khi đầy
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def peek(self, key):
+        """
+        Lấy giá trị kể cả khi đã hết hạn ttl, không đổi thứ tự LRU
+        """
+        with self._lock:
+            item = self._data.get(key)
+            return None if item is None else item[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+class RateLimiter:
+    """
+    Giãn cách lệnh gọi theo số request/phút (token bucket), dùng chung được giữa
+    các thread và event loop
+    """
+    def __init__(self, rate_per_minute, burst=1):
+        self.interval = 60 / rate_per_minute
+        self.burst = burst
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    async def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            # Sau thời gian rảnh được dồn tối đa burst lệnh gọi, sau đó mỗi lệnh cách nhau interval
+            start = max(self._next, now - self.interval * (self.burst - 1))
+            self._next = start + self.interval
+            delay = start - now
+        if delay > 0:
+            await asyncio.sleep(delay)
 
 class NewsArticleGenerator:
     def __init__(self):
         self.gemini_api_key = check_api_key()
-        genai.configure(api_key=self.gemini_api_key)
-        self.model = genai.GenerativeModel('gemini-pro')
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
+        self.model = get_model(self.gemini_api_key)
+        self.headers = HEADERS
+        # Mỗi event loop (mỗi lần run_async của từng người dùng) có session riêng
+        self._sessions = {}
+        # Cache phản hồi Gemini theo hash của prompt (giữ một ngày)
+        self._llm_cache = LRUCache(maxsize=128, ttl=86400)
+        # Chủ động giãn cách request thay vì chờ bị trả về 429
+        self._limiter = RateLimiter(_GEMINI_RPM, burst=_GEMINI_BURST)
+        # Cache bài đã đọc và trích xuất theo URL
+        self._url_cache = LRUCache(maxsize=256, ttl=3600)
+        # Parse HTML trên thread pool (lxml nhả GIL khi parse), event loop chỉ lo I/O.
+        # Không dùng process pool: Streamlit tạo lại __main__ mỗi lần rerun nên
+        # extract_content của generator đã cache không pickle được
+        self._executor = ThreadPoolExecutor()
 
-    async def fetch_url(self, url):
+    async def _get_session(self):
         """
-        Đọc nội dung từ URL
+        Lấy ClientSession dùng chung (tạo khi cần) để tái sử dụng kết nối
+        """
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                headers=self.headers,
+                timeout=_DEFAULT_TIMEOUT,
+                connector=aiohttp.TCPConnector(
+                    limit=100,
+                    limit_per_host=8,
+                    ttl_dns_cache=300,
+                    ssl=_SSL_CONTEXT
+                )
+            )
+            self._sessions[loop] = session
+        return session
+
+    async def aclose(self):
+        """
+        Đóng ClientSession dùng chung của event loop hiện tại
+        """
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None and not session.closed:
+            await session.close()
+
+    async def fetch_url(self, url, validators=None):
+        """
+        Đọc nội dung từ URL, trả về (html, validators) với validators là các header
+        GET có điều kiện (If-None-Match/If-Modified-Since) lấy từ ETag/Last-Modified.
+        Nếu truyền validators của lần đọc trước và server trả 304 thì html là None
         """
         try:
-            async with aiohttp.ClientSession(headers=self.headers) as session:
-                async with session.get(url) as response:
-                    return await response.text()
+            session = await self._get_session()
+            async with session.get(url, headers=validators) as response:
+                if validators and response.status == 304:
+                    return None, validators
+                # Trang lỗi (4xx/5xx) hay không phải HTML (PDF, ảnh...) bỏ luôn, không tải phần thân
+                if response.status >= 400:
+                    # Không dùng raise_for_status: thông báo của nó lặp lại URL
+                    raise Exception(f"HTTP {response.status} {response.reason}")
+                if 'Content-Type' in response.headers and response.content_type not in _HTML_TYPES:
+                    raise Exception(f"không phải trang HTML ({response.content_type})")
+                
+                validators = {
+                    header: response.headers[source]
+                    for header, source in (('If-None-Match', 'ETag'),
+                                           ('If-Modified-Since', 'Last-Modified'))
+                    if source in response.headers
+                }
+                # Đọc từng phần và dừng ở _MAX_HTML_BYTES thay vì tải cả trang vào bộ nhớ
+                raw = bytearray()
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    raw += chunk
+                    if len(raw) >= _MAX_HTML_BYTES:
+                        break
+                del raw[_MAX_HTML_BYTES:]
+                try:
+                    html = raw.decode(response.charset or 'utf-8', errors='replace')
+                except LookupError:
+                    # Charset lạ trong header
+                    html = raw.decode('utf-8', errors='replace')
+                return html, validators
         except Exception as e:
-            raise Exception(f"Lỗi khi đọc URL {url}: {str(e)}")
+            raise Exception(f"Lỗi khi đọc URL: {str(e)}")
 
     def extract_content(self, html):
         """
         Trích xuất nội dung từ HTML
         """
-        try:
-            soup = BeautifulSoup(html, 'html.parser')
-            
-            # Loại bỏ các phần không cần thiết
-            for tag in soup(['script', 'style', 'nav', 'header', 'footer', 'iframe', 'aside']):
-                tag.decompose()
-            
-            # Lấy tiêu đề
-            title = ""
-            if soup.find('h1'):
-                title = soup.find('h1').get_text().strip()
-            elif soup.find('title'):
-                title = soup.find('title').get_text().strip()
-            
-            # Lấy nội dung chính
-            article_tags = soup.find_all(['article', 'main', 'div'], class_=['content', 'article', 'post'])
-            content = ""
-            
-            if article_tags:
-                for tag in article_tags:
-                    paragraphs = tag.find_all('p')
-                    content += ' '.join([p.get_text().strip() for p in paragraphs])
-            else:
-                # Nếu không tìm thấy thẻ article, lấy tất cả thẻ p
-                paragraphs = soup.find_all('p')
-                content = ' '.join([p.get_text().strip() for p in paragraphs])
-            
-            return {
-                'title': title,
-                'content': content
-            }
-            
-        except Exception as e:
-            raise Exception(f"Lỗi khi xử lý HTML: {str(e)}")
+        return extract_content(html)
 
-    async def scrape_articles(self, urls):
+    async def scrape_articles(self, urls, no_cache=False):
         """
-        Thu thập nội dung từ nhiều URLs
+        Thu thập nội dung từ nhiều URLs (no_cache=True để đọc lại thay vì dùng cache)
         """
+        urls = [url for url in urls if url.strip()]
+        try:
+            # Đọc các URLs đồng thời thay vì lần lượt từng URL
+            results = await asyncio.gather(
+                *[self._fetch_and_extract(url, no_cache) for url in urls],
+                return_exceptions=True
+            )
+        finally:
+            # Session gắn với event loop hiện tại nên phải đóng trước khi run_async kết thúc
+            await self.aclose()
+        
+        # Bỏ qua URL lỗi, vẫn tổng hợp từ các URL còn lại
         articles = []
-        for url in urls:
-            if url.strip():
-                html = await self.fetch_url(url)
-                content = self.extract_content(html)
-                articles.append({
-                    'url': url,
-                    'title': content['title'],
-                    'content': content['content']
-                })
+        for url, result in zip(urls, results):
+            if isinstance(result, BaseException):
+                st.warning(f"⚠️ Bỏ qua {url}: {result}")
+            else:
+                articles.append(result)
         return articles
 
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=4, max=10),
-        reraise=True
-    )
-    async def call_gemini_api(self, prompt):
+    async def _fetch_and_extract(self, url, no_cache=False):
         """
-        Gọi Gemini API với retry
+        Đọc một URL và trích xuất nội dung trên thread pool
         """
-        try:
-            response = self.model.generate_content(prompt)
-            return response.text
-        except Exception as e:
-            if "429" in str(e):
-                st.warning("Đang chờ API... Vui lòng đợi trong giây lát")
-                time.sleep(5)
-                raise e
-            raise e
+        cached = None if no_cache else self._url_cache.get(url)
+        if cached is not None:
+            return cached[0]
+        
+        # Bản cache đã hết hạn: hỏi lại server bằng GET có điều kiện, 304 thì dùng tiếp
+        stale = None if no_cache else self._url_cache.peek(url)
+        html, validators = await self.fetch_url(url, stale[1] if stale else None)
+        if html is None:
+            self._url_cache.set(url, stale)
+            return stale[0]
+        
+        loop = asyncio.get_running_loop()
+        content = await loop.run_in_executor(self._executor, extract_content, html)
+        article = {
+            'url': url,
+            'title': content['title'],
+            'content': content['content']
+        }
+        # Trích xuất rỗng thường là trang chặn bot/xin đồng ý cookie: không cache để lần sau đọc lại
+        if article['content']:
+            self._url_cache.set(url, (article, validators))
+        return article
 
-    async def generate_article(self, articles):
+    async def call_gemini_api(self, prompt, no_cache=False, parse=None):
         """
-        Tạo bài báo từ nhiều nguồn
+        Gọi Gemini API với retry, dùng lại kết quả nếu prompt đã gọi trước đó
+        (no_cache=True để bỏ qua cache và gọi lại API). Nếu có parse thì trả về
+        parse(text); chỉ kết quả parse thành công mới được cache, để phản hồi sai
+        định dạng (từ chối, thiếu nhãn...) được gọi lại ở lần sau
+        """
+        cache_key = hashlib.sha256(prompt.encode()).hexdigest()
+        cached = None if no_cache else self._llm_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        for attempt in range(_GEMINI_MAX_ATTEMPTS):
+            await self._limiter.acquire()
+            try:
+                # generate_content là lệnh gọi đồng bộ, chạy trên thread để không chặn event loop
+                response = await asyncio.to_thread(self.model.generate_content, prompt)
+                result = parse(response.text) if parse else response.text
+                self._llm_cache.set(cache_key, result)
+                return result
+            except _RETRYABLE_ERRORS as e:
+                if attempt == _GEMINI_MAX_ATTEMPTS - 1:
+                    raise
+                # Backoff mũ 4s, 8s (tối đa 10s) cộng jitter ±25% để các lượt retry không dồn
+                # cùng lúc; lỗi 429 thì theo thời gian chờ server gợi ý
+                delay = min(10, 4 * 2 ** attempt) * random.uniform(0.75, 1.25)
+                if isinstance(e, google_exceptions.TooManyRequests):
+                    st.warning("Đang chờ API... Vui lòng đợi trong giây lát")
+                    delay = retry_after(e) or delay + 5
+                await asyncio.sleep(delay)
+
+    async def generate_article(self, articles, no_cache=False):
+        """
+        Tạo bài báo từ nhiều nguồn (no_cache=True để gọi lại Gemini thay vì dùng cache)
         """
         try:
-            # Tổng hợp nội dung từ các bài báo
+            # Tổng hợp nội dung từ các bài báo, bỏ câu trùng giữa các nguồn để giảm token
+            seen = set()
             combined_content = "\n\n---\n\n".join(
-                [f"Tiêu đề: {a['title']}\nNội dung: {a['content']}" for a in articles]
+                f"Tiêu đề: {a['title']}\nNội dung: {dedupe_sentences(a['content'], seen)}"
+                for a in articles
             )
 
             # Prompt để phân tích và tổng hợp thành bài báo mới
-            analysis_prompt = f"""
-            Phân tích và tổng hợp thành một bài báo mới từ các nguồn sau:
-
-            {combined_content}
-
-            Yêu cầu:
-
-            1. Tiêu đề bài báo:
-               - Tối đa 15 từ
-               - Thu hút, tạo ấn tượng mạnh
-               - Phản ánh chính xác nội dung chính
-               - Sử dụng từ ngữ báo chí chuẩn mực
-               - Tránh giật gân, câu view
-
-            2. Cấu trúc bài viết:
-               - Tóm tắt ý chính trong đoạn mở đầu (3-4 câu)
-               - Triển khai chi tiết theo logic rõ ràng
-               - Dẫn nguồn và trích dẫn khi cần
-               - Phân tích, đánh giá khách quan
-               - Kết luận súc tích, đầy đủ
-
-            3. Nội dung:
-               - Tổng hợp thông tin từ nhiều nguồn
-               - Đảm bảo tính chính xác
-               - Cung cấp góc nhìn đa chiều
-               - Thêm số liệu, dữ liệu cụ thể
-               - Độ dài 800-1000 từ
-
-            4. Ngôn ngữ:
-               - Trong sáng, dễ hiểu
-               - Phong cách báo chí chuyên nghiệp
-               - Khách quan, trung lập
-               - Tránh từ ngữ cảm xúc, thiên kiến
-               - Chọn lọc từ ngữ phù hợp văn phong
-
-            Format phản hồi:
-            TITLE: [tiêu đề bài báo]
-            ARTICLE: [nội dung bài báo]
-            """
+            analysis_prompt = _ANALYSIS_INSTRUCTIONS + combined_content
 
             # Gọi API để tạo bài báo
-            result = await self.call_gemini_api(analysis_prompt)
+            title, content = await self.call_gemini_api(
+                analysis_prompt, no_cache, parse=parse_article_response
+            )
             
             try:
-                title = result.split('TITLE:')[1].split('ARTICLE:')[0].strip()
-                content = result.split('ARTICLE:')[1].strip()
+                
+                # Rút gọn tiêu đề và mở rộng nội dung không phụ thuộc nhau
+                # nên gửi đồng thời thay vì chờ lần lượt từng lệnh gọi
+                calls = {}
                 
                 # Kiểm tra độ dài tiêu đề
-                if len(title.split()) > 15:
-                    optimize_title_prompt = f"""
-                    Tối ưu tiêu đề sau để ngắn gọn hơn (tối đa 15 từ) nhưng vẫn giữ được ý chính:
-                    {title}
-
-                    Yêu cầu:
-                    - Rút gọn nhưng không mất ý nghĩa
-                    - Vẫn phải thu hút, ấn tượng
-                    - Dùng từ ngữ chính xác, súc tích
-                    - Phù hợp phong cách báo chí
-
-                    Format: TITLE: [tiêu đề tối ưu]
-                    """
-                    title_result = await self.call_gemini_api(optimize_title_prompt)
-                    title = title_result.split('TITLE:')[1].strip()
+                if count_words(title) > _TITLE_REWRITE_WORDS:
+                    optimize_title_prompt = _OPTIMIZE_TITLE_PROMPT.format(title=title)
+                    calls['title'] = self.call_gemini_api(
+                        optimize_title_prompt, no_cache, parse=parse_title_response
+                    )
                 
                 # Kiểm tra độ dài nội dung
-                word_count = len(content.split())
-                if word_count < 800:
-                    expand_prompt = f"""
-                    Mở rộng nội dung bài báo sau để đạt 800-1000 từ.
-                    Thêm chi tiết, phân tích sâu hơn nhưng vẫn giữ được tính mạch lạc và phong cách ban đầu.
-
-                    Bài báo hiện tại:
-                    {content}
-                    """
-                    content = await self.call_gemini_api(expand_prompt)
+                word_count = count_words(content)
+                if word_count < _EXPAND_BELOW_WORDS and len(combined_content) > _EXPAND_MIN_SOURCE_CHARS:
+                    expand_prompt = _EXPAND_PROMPT.format(content=content)
+                    calls['expand'] = self.call_gemini_api(expand_prompt, no_cache)
+                
+                # Chờ cả hai lệnh gọi kết thúc rồi mới báo lỗi (nếu có), để không bỏ
+                # lại lệnh kia chạy mồ côi trên thread sau khi hàm đã thoát
+                results = await asyncio.gather(*calls.values(), return_exceptions=True)
+                for result in results:
+                    if isinstance(result, BaseException):
+                        raise result
+                results = dict(zip(calls, results))
+                
+                if 'title' in results:
+                    title = results['title']
+                
+                if 'expand' in results:
+                    content = results['expand']
+                    word_count = count_words(content)
                 
                 return {
                     'title': title,
                     'content': content,
-                    'word_count': len(content.split()),
+                    'word_count': word_count,
                     'sources': [a['url'] for a in articles]
                 }
                 
@@ -225,6 +563,33 @@ class NewsArticleGenerator:
         except Exception as e:
             raise Exception(f"Lỗi khi tạo bài báo: {str(e)}")
 
+@st.cache_resource
+def get_generator():
+    """
+    Một NewsArticleGenerator cho cả process, dùng chung model, thread pool và cache
+    giữa các phiên người dùng
+    """
+    return NewsArticleGenerator()
+
+async def run_pipeline(generator, urls, status, progress, no_cache=False):
+    """
+    Đọc các URLs rồi tạo bài báo trong cùng một event loop
+    (trả về None nếu không đọc được bài nào; no_cache=True để bỏ qua mọi cache)
+    """
+    # Thu thập nội dung
+    status.text("Đang đọc nội dung từ các URLs...")
+    progress.progress(25)
+    
+    articles = await generator.scrape_articles(urls, no_cache)
+    if not articles:
+        return None
+    
+    # Tạo bài báo
+    status.text("Đang tổng hợp và viết bài...")
+    progress.progress(50)
+    
+    return await generator.generate_article(articles, no_cache)
+
 def main():
     st.set_page_config(
         page_title="Tổng Hợp Tin Tức", 
@@ -239,8 +604,7 @@ def main():
     """)
     st.markdown("---")
 
-    if 'generator' not in st.session_state:
-        st.session_state.generator = NewsArticleGenerator()
+    generator = get_generator()
 
     with st.container():
         st.subheader("🔗 Nhập URLs Bài Báo")
@@ -257,10 +621,15 @@ def main():
                 )
                 urls.append(url)
         
+        refresh = st.checkbox(
+            "🔄 Làm mới (bỏ qua cache)",
+            help="Đọc lại các URLs và gọi lại Gemini thay vì dùng kết quả đã lưu"
+        )
+        
         # Nút tạo bài báo
         if st.button("Tạo Bài Báo", type="primary"):
             # Kiểm tra URLs
-            valid_urls = [url for url in urls if url.strip()]
+            valid_urls = [url.strip() for url in urls if url.strip()]
             if len(valid_urls) == 0:
                 st.warning("⚠️ Vui lòng nhập ít nhất một URL!")
                 return
@@ -276,26 +645,14 @@ def main():
             
             try:
                 with st.spinner("Đang xử lý..."):
-                    # Thu thập nội dung
-                    status.text("Đang đọc nội dung từ các URLs...")
-                    progress.progress(25)
-                    
-                    articles = asyncio.run(
-                        st.session_state.generator.scrape_articles(valid_urls)
+                    result = run_async(
+                        run_pipeline(generator, valid_urls, status, progress, refresh)
                     )
                     
-                    if not articles:
+                    if result is None:
                         st.error("❌ Không thể đọc nội dung từ các URLs!")
                         return
                     
-                    # Tạo bài báo
-                    status.text("Đang tổng hợp và viết bài...")
-                    progress.progress(50)
-                    
-                    result = asyncio.run(
-                        st.session_state.generator.generate_article(articles)
-                    )
-                    
                     if result:
                         progress.progress(100)
                         status.empty()